@@ -1,88 +1,354 @@
 # database/db.py
+import atexit
+import operator
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence
 from datetime import datetime
 
 from werkzeug.security import generate_password_hash  # 创建默认账号密码哈希
 
 DB_PATH = Path(__file__).resolve().parent / "sales.db"
 
-
-# ===========================
-# 基础: 连接 & 初始化
-# ===========================
-def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+# 每个连接只需要设置一次的 PRAGMA：
+# WAL + synchronous=NORMAL 让读写互不阻塞、减少 fsync，
+# 其余几个把临时表/页缓存放进内存，保持缓存“热”。
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    # 偶发的写-写竞争（如 checkpoint 撞上 POST）等锁而不是立刻 SQLITE_BUSY
+    "PRAGMA busy_timeout=5000",
+)
+
+# 读连接池大小（WAL 下多个读连接可并发；写始终只有一个）
+_POOL_SIZE = 8
+
+
+def _new_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=256,
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
-def init_db() -> None:
+class _Pool:
     """
-    整个应用只需要执行一次（如在 run.py 启动时），
-    用来创建所有需要的表。
+    简单的 SQLite 连接池：_POOL_SIZE 个预建的只读连接 + 1 个写连接。
+    读连接用 Queue 借还，写连接用锁串行化（SQLite 本来就是单写者）。
     """
-    conn = get_connection()
-    cur = conn.cursor()
-
-    # 单据表
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS slips (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            slip_date TEXT NOT NULL,         -- 营业日: YYYY-MM-DD
-            table_name TEXT,                 -- 桌号
-            people INTEGER NOT NULL,         -- 人数
-            amount INTEGER NOT NULL,         -- 金额
-            payment_method TEXT,             -- 支付方式: cash / credit / wechat / paypay / alipay
-            created_at TEXT NOT NULL         -- 记录时间: YYYY-MM-DD HH:MM
-        )
-        """
-    )
 
-    # 食物统计表
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS food_sales (
-            business_date TEXT PRIMARY KEY,  -- 营业日
-            steak INTEGER DEFAULT 0,
-            beef_cube INTEGER DEFAULT 0,
-            beef_skewer INTEGER DEFAULT 0,
-            burger INTEGER DEFAULT 0,
-            sandwich INTEGER DEFAULT 0,
-            shrimp INTEGER DEFAULT 0
-        )
-        """
+    def __init__(self, size: int = _POOL_SIZE) -> None:
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._readers.put(_new_connection())
+        self._writer = _new_connection()
+        self._writer_lock = threading.Lock()
+
+    @contextmanager
+    def borrow(self, readonly: bool = True) -> Iterator[sqlite3.Connection]:
+        if readonly:
+            conn = self._readers.get()
+            try:
+                yield conn
+            finally:
+                self._readers.put(conn)
+        else:
+            with self._writer_lock:
+                yield self._writer
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+        # 退出前增量更新 sqlite_stat1，下次启动计划器心里有数
+        try:
+            self._writer.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            pass
+        self._writer.close()
+
+
+_pool: Optional[_Pool] = None
+_pool_lock = threading.Lock()
+
+# 查询结果缓存：写操作递增对应表的版本号，版本号参与缓存 key，
+# 这样写入之后旧版本的缓存条目自然失效，不用显式清理。
+_cache_versions: Dict[str, int] = {"slips": 0, "food_sales": 0, "segments": 0}
+
+
+def _bump_version(table: str) -> None:
+    _cache_versions[table] += 1
+
+
+# 食物列名固定（视图解析表单时也按这个顺序取字段），
+# itemgetter 在 C 层一次取全部六列
+FOOD_COLS = ("steak", "beef_cube", "beef_skewer", "burger", "sandwich", "shrimp")
+_get_food = operator.itemgetter(*FOOD_COLS)
+
+# 支付方式及显示名（顺序即首页展示顺序）
+PAYMENT_LABELS = (
+    ("cash", "现金"),
+    ("credit", "クレジットカード"),
+    ("wechat", "WeChat Pay"),
+    ("paypay", "PayPay"),
+    ("alipay", "支付宝"),
+)
+
+# 没有记录的支付方式也要出现在汇总里（金额 0），
+# 用 VALUES CTE + LEFT JOIN 直接在 SQL 里补齐，省掉 Python 侧的填充循环。
+_PAYMENT_SUMMARY_SQL = (
+    "WITH methods(method, label, ord) AS (VALUES "
+    + ", ".join(
+        "('%s', '%s', %d)" % (method, label, i)
+        for i, (method, label) in enumerate(PAYMENT_LABELS)
     )
-
-    # 负责人时间段表
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS segments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            business_date TEXT NOT NULL,
-            start_time TEXT NOT NULL,        -- HH:MM
-            end_time TEXT NOT NULL,          -- HH:MM
-            staff_name TEXT NOT NULL
-        )
-        """
+    + ") "
+    "SELECT m.method AS method, m.label AS label, "
+    "COALESCE(SUM(s.amount), 0) AS amount "
+    "FROM methods m "
+    "LEFT JOIN slips s ON s.payment_method = m.method AND s.slip_date = ? "
+    "GROUP BY m.ord, m.method, m.label "
+    "ORDER BY m.ord"
+)
+
+
+# CSV 导出：支付方式 -> 显示名 的映射放进 CASE，在 SQLite 的 C 代码里
+# 完成，Python 不再逐行查 dict；列顺序即 CSV 列顺序
+_Q_EXPORT_SLIPS = (
+    "SELECT id, slip_date, COALESCE(table_name, ''), people, amount, "
+    "CASE payment_method "
+    + " ".join("WHEN '%s' THEN '%s'" % (m, label) for m, label in PAYMENT_LABELS)
+    + " ELSE COALESCE(payment_method, '') END, created_at "
+    "FROM slips ORDER BY slip_date DESC, id DESC"
+)
+
+
+# 语句字符串做成模块常量：每次调用传同一个对象，
+# sqlite3 连接上的 prepared-statement 缓存必定命中，免去重复 parse/plan
+_Q_INSERT_SLIP = """
+    INSERT INTO slips (slip_date, table_name, people, amount, payment_method, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+_Q_SLIP_BY_ID = "SELECT * FROM slips WHERE id = ?"
+
+# time 列（HH:MM）直接在 SQL 里从 created_at 切出来，省掉视图层的逐行循环
+_Q_SLIPS_BY_DATE = """
+    SELECT *, substr(created_at, 12, 5) AS time
+    FROM slips
+    WHERE slip_date = ?
+    ORDER BY id ASC
+"""
+
+_Q_ALL_SLIPS = "SELECT * FROM slips ORDER BY slip_date DESC, id DESC"
+
+_Q_RECENT_DATES = """
+    SELECT slip_date
+    FROM slips
+    GROUP BY slip_date
+    ORDER BY slip_date DESC
+    LIMIT ?
+"""
+
+_Q_FOOD_BY_DATE = """
+    SELECT steak, beef_cube, beef_skewer, burger, sandwich, shrimp
+    FROM food_sales
+    WHERE business_date = ?
+"""
+
+_Q_FOOD_TOTALS = """
+    SELECT
+        COALESCE(SUM(steak), 0)        AS steak,
+        COALESCE(SUM(beef_cube), 0)    AS beef_cube,
+        COALESCE(SUM(beef_skewer), 0)  AS beef_skewer,
+        COALESCE(SUM(burger), 0)       AS burger,
+        COALESCE(SUM(sandwich), 0)     AS sandwich,
+        COALESCE(SUM(shrimp), 0)       AS shrimp
+    FROM (
+        SELECT steak, beef_cube, beef_skewer, burger, sandwich, shrimp
+        FROM food_sales
+        ORDER BY business_date DESC
+        LIMIT ?
     )
-
-    # 用户表（登录系统）
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            password_hash TEXT NOT NULL,
-            created_at TEXT NOT NULL
-        )
-        """
+"""
+
+_Q_INSERT_SEGMENT = """
+    INSERT INTO segments (business_date, start_time, end_time, staff_name)
+    VALUES (?, ?, ?, ?)
+"""
+
+_Q_SEGMENTS_BY_DATE = """
+    SELECT id, business_date, start_time, end_time, staff_name
+    FROM segments
+    WHERE business_date = ?
+    ORDER BY start_time ASC
+"""
+
+_Q_SEGMENT_BY_ID = """
+    SELECT id, business_date, start_time, end_time, staff_name
+    FROM segments
+    WHERE id = ?
+"""
+
+_Q_SLIP_AGGREGATES = """
+    SELECT COALESCE(SUM(amount), 0) AS total_sales,
+           COALESCE(SUM(people), 0) AS total_customers,
+           COUNT(*) AS total_tables
+    FROM slips
+    WHERE slip_date = ?
+"""
+
+_Q_DAILY_SALES = """
+    SELECT *
+    FROM (
+        SELECT slip_date,
+               SUM(amount) AS total_sales,
+               SUM(people) AS total_customers
+        FROM slips
+        GROUP BY slip_date
+        ORDER BY slip_date DESC
+        LIMIT ?
     )
+    ORDER BY slip_date ASC
+"""
+
+
+# schema 版本：DDL 有变化时 +1，init_db 据此决定要不要重跑
+_SCHEMA_VERSION = 3
+
+# 全部建表/建索引语句一次 executescript 执行，省掉逐条 parse/plan
+_DDL = """
+CREATE TABLE IF NOT EXISTS slips (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    slip_date TEXT NOT NULL,         -- 营业日: YYYY-MM-DD
+    table_name TEXT,                 -- 桌号
+    people INTEGER NOT NULL,         -- 人数
+    amount INTEGER NOT NULL,         -- 金额
+    payment_method TEXT,             -- 支付方式: cash / credit / wechat / paypay / alipay
+    created_at TEXT NOT NULL         -- 记录时间: YYYY-MM-DD HH:MM
+);
+
+CREATE TABLE IF NOT EXISTS food_sales (
+    business_date TEXT PRIMARY KEY,  -- 营业日
+    steak INTEGER DEFAULT 0,
+    beef_cube INTEGER DEFAULT 0,
+    beef_skewer INTEGER DEFAULT 0,
+    burger INTEGER DEFAULT 0,
+    sandwich INTEGER DEFAULT 0,
+    shrimp INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    business_date TEXT NOT NULL,
+    start_time TEXT NOT NULL,        -- HH:MM
+    end_time TEXT NOT NULL,          -- HH:MM
+    staff_name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+-- 按营业日的查询/汇总都走索引，避免全表扫描
+-- （food_sales 的 business_date 本身就是主键，不用额外建）
+CREATE INDEX IF NOT EXISTS idx_slips_date_id ON slips(slip_date, id);
+-- 支付方式汇总的覆盖索引：带上 amount 后 SUM 走纯索引扫描，不回表
+-- （旧的 (slip_date, payment_method) 两列索引是它的前缀，一并清掉）
+DROP INDEX IF EXISTS idx_slips_date_pm;
+CREATE INDEX IF NOT EXISTS idx_slips_date_pm_amt ON slips(slip_date, payment_method, amount);
+-- 每日汇总 SUM(people)/SUM(amount)/COUNT(*) 的覆盖索引，整条查询不回表
+CREATE INDEX IF NOT EXISTS idx_slips_date_people_amt ON slips(slip_date, people, amount);
+CREATE INDEX IF NOT EXISTS idx_segments_date_start ON segments(business_date, start_time);
+"""
+
+
+# ===========================
+# 基础: 连接 & 初始化
+# ===========================
+def _get_pool() -> _Pool:
+    """全部查询函数共用这组池化连接，任何路径都不做按次 open/close。"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _Pool()
+    return _pool
+
+
+@contextmanager
+def _raw_rows(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    临时关掉 row_factory：聚合查询只按列位置取值，
+    裸 tuple 比 sqlite3.Row 解码快一截。
+    """
+    old = conn.row_factory
+    conn.row_factory = None
+    try:
+        yield conn
+    finally:
+        conn.row_factory = old
+
+
+@atexit.register
+def _close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.close_all()
+        _pool = None
 
-    conn.commit()
-    conn.close()
+
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def init_db() -> None:
+    """
+    整个应用只需要执行一次（如在 run.py 启动时），
+    用来创建所有需要的表。
+    同一进程内重复调用（如 flask 调试 reloader）直接返回；
+    schema 没变时（user_version 已是当前值）也不再逐条跑 DDL。
+    """
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        with _get_pool().borrow(readonly=False) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+                conn.executescript(_DDL)
+                conn.execute("PRAGMA user_version = %d" % _SCHEMA_VERSION)
+        _initialized = True
+
+
+def warmup() -> None:
+    """
+    启动时把业务表整体扫一遍，让页面进 OS 页缓存 / mmap 窗口，
+    首个请求就不用付冷盘 I/O。COUNT(*) 走全表/索引扫描正合适。
+    """
+    with _get_pool().borrow() as conn:
+        for table in ("slips", "food_sales", "segments"):
+            conn.execute("SELECT COUNT(*) FROM %s" % table).fetchone()
 
 
 # ===========================
@@ -96,17 +362,32 @@ def insert_slip(
     payment_method: str,
     created_at: str,
 ) -> None:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO slips (slip_date, table_name, people, amount, payment_method, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (slip_date, table_name, people, amount, payment_method, created_at),
-    )
-    conn.commit()
-    conn.close()
+    with _get_pool().borrow(readonly=False) as conn:
+        with conn:
+            conn.execute(
+                _Q_INSERT_SLIP,
+                (slip_date, table_name, people, amount, payment_method, created_at),
+            )
+    _bump_version("slips")
+
+
+def insert_slips_bulk(rows: List[tuple]) -> None:
+    """
+    批量插入单据（如 CSV 导入 / 重放一天的数据）。
+    rows: [(slip_date, table_name, people, amount, payment_method, created_at), ...]
+    一个事务 + executemany，避免每行一次 fsync。
+    """
+    if not rows:
+        return
+    with _get_pool().borrow(readonly=False) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_Q_INSERT_SLIP, rows)
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    _bump_version("slips")
 
 
 def update_slip(
@@ -114,140 +395,192 @@ def update_slip(
     table_name: Optional[str],
     people: int,
     amount: int,
-    payment_method: str,
-) -> None:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE slips
-        SET table_name = ?, people = ?, amount = ?, payment_method = ?
-        WHERE id = ?
-        """,
-        (table_name, people, amount, payment_method, slip_id),
-    )
-    conn.commit()
-    conn.close()
+    payment_method: Optional[str] = None,
+) -> Optional[str]:
+    """
+    更新单据并返回其营业日（单据不存在则返回 None）。
+    RETURNING 让更新和取 slip_date 合成一条语句，调用方不用先
+    get_slip 再改。payment_method 传 None 表示保持原值。
+    """
+    with _get_pool().borrow(readonly=False) as conn:
+        with conn:
+            row = conn.execute(
+                """
+                UPDATE slips
+                SET table_name = ?, people = ?, amount = ?,
+                    payment_method = COALESCE(?, payment_method)
+                WHERE id = ?
+                RETURNING slip_date
+                """,
+                (table_name, people, amount, payment_method, slip_id),
+            ).fetchone()
+    _bump_version("slips")
+    return row["slip_date"] if row else None
+
+
+def delete_slip(slip_id: int) -> Optional[str]:
+    """删除单据，返回其营业日；不存在返回 None。"""
+    with _get_pool().borrow(readonly=False) as conn:
+        with conn:
+            row = conn.execute(
+                "DELETE FROM slips WHERE id = ? RETURNING slip_date", (slip_id,)
+            ).fetchone()
+    _bump_version("slips")
+    return row["slip_date"] if row else None
+
+
+def get_slip(slip_id: int) -> Optional[sqlite3.Row]:
+    with _get_pool().borrow() as conn:
+        return conn.execute(_Q_SLIP_BY_ID, (slip_id,)).fetchone()
+
+
+def get_slips_by_ids(ids: Sequence[int]) -> Dict[int, sqlite3.Row]:
+    """
+    一次取多张单据，按 id 索引返回。
+    比循环调 get_slip 少 N-1 次查询；超过 SQLite 的参数上限时分块。
+    """
+    result: Dict[int, sqlite3.Row] = {}
+    if not ids:
+        return result
+    chunk_size = 999  # SQLite 默认的绑定参数上限
+    with _get_pool().borrow() as conn:
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                "SELECT * FROM slips WHERE id IN (%s)" % placeholders,
+                tuple(chunk),
+            ).fetchall()
+            for row in rows:
+                result[row["id"]] = row
+    return result
 
 
-def delete_slip(slip_id: int) -> None:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM slips WHERE id = ?", (slip_id,))
-    conn.commit()
-    conn.close()
+def get_slips_by_date(slip_date: str) -> List[sqlite3.Row]:
+    """
+    直接返回 sqlite3.Row：time 列已在 SQL 里算好，视图不再改行，
+    模板用 slip.time / slip["amount"] 都能取，省掉每行一次 dict 拷贝。
+    """
+    with _get_pool().borrow() as conn:
+        return conn.execute(_Q_SLIPS_BY_DATE, (slip_date,)).fetchall()
 
 
-def get_slip(slip_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT *
-        FROM slips
-        WHERE id = ?
-        """,
-        (slip_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+def get_all_slips() -> List[sqlite3.Row]:
+    """
+    获取 slips 表中的所有单据，按日期和 ID 排序（用于 CSV 导出）。
+    直接返回 sqlite3.Row（支持 row["col"] 访问），省掉每行一个 dict。
+    """
+    with _get_pool().borrow() as conn:
+        return conn.execute(_Q_ALL_SLIPS).fetchall()
 
 
-def get_slips_by_date(slip_date: str) -> List[Dict[str, Any]]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT *
-        FROM slips
-        WHERE slip_date = ?
-        ORDER BY id ASC
-        """,
-        (slip_date,),
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+def iter_all_slips(batch: int = 1000) -> Iterator[sqlite3.Row]:
+    """
+    逐批迭代所有单据（CSV 导出用）。
+    同一时刻内存里最多 batch 行，不像 get_all_slips 整表物化。
+    """
+    with _get_pool().borrow() as conn:
+        cur = conn.cursor()
+        cur.arraysize = batch
+        cur.execute(_Q_ALL_SLIPS)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            yield from rows
+
+
+def get_slips_fingerprint() -> tuple:
+    """
+    slips 表当前状态的指纹 (最大 rowid, 行数, 本进程写版本号)，
+    一次索引探测拿到。rowid/行数抓不到原地 UPDATE，由写版本号兜底。
+    导出接口用它拼 ETag：表没变就 304，整条 SQL+CSV 流水线都省掉。
+    """
+    with _get_pool().borrow() as conn:
+        with _raw_rows(conn):
+            max_rowid, count = conn.execute(
+                "SELECT COALESCE(MAX(rowid), 0), COUNT(*) FROM slips"
+            ).fetchone()
+    return max_rowid, count, _cache_versions["slips"]
 
 
-def get_all_slips() -> List[Dict[str, Any]]:
+def iter_slips_for_export(batch: int = 1000) -> Iterator[tuple]:
     """
-    获取 slips 表中的所有单据，按日期和 ID 排序（用于 CSV 导出）
+    逐批迭代导出用的行：普通 tuple、支付方式已映射成显示名、
+    列顺序与 CSV 一致，取出即可直接拼行。
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT *
-        FROM slips
-        ORDER BY slip_date DESC, id DESC
-        """
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    with _get_pool().borrow() as conn:
+        with _raw_rows(conn):
+            cur = conn.cursor()
+            cur.arraysize = batch
+            cur.execute(_Q_EXPORT_SLIPS)
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+                yield from rows
 
 
 def get_recent_dates(limit: int = 7) -> List[str]:
     """
     最近有单据的营业日（新的在前）
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT DISTINCT slip_date
-        FROM slips
-        ORDER BY slip_date DESC
-        LIMIT ?
-        """,
-        (limit,),
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return [r["slip_date"] for r in rows]
+    return _recent_dates_cached(limit, _cache_versions["slips"])
+
+
+@lru_cache(maxsize=256)
+def _recent_dates_cached(limit: int, version: int) -> List[str]:
+    # GROUP BY 走 idx_slips_date_id 的跳跃扫描
+    with _get_pool().borrow() as conn:
+        with _raw_rows(conn):
+            return [r[0] for r in conn.execute(_Q_RECENT_DATES, (limit,))]
+
+
+def _summary_from_agg(agg: sqlite3.Row) -> Dict[str, int]:
+    """把聚合查询的一行变成 summary dict（客单价在这儿算）。"""
+    total_sales = agg["total_sales"]
+    total_customers = agg["total_customers"]
+    return {
+        "total_sales": total_sales,
+        "total_customers": total_customers,
+        "total_tables": agg["total_tables"],
+        "avg_per_customer": int(total_sales / total_customers) if total_customers else 0,
+    }
+
+
+def get_slip_aggregates_by_date(slip_date: str) -> Dict[str, int]:
+    """
+    某营业日的汇总：营业额 / 客数 / 桌数 / 客单价。
+    一条聚合查询在 SQLite 里算完，不把明细行拉进 Python 再循环。
+    """
+    with _get_pool().borrow() as conn:
+        agg = conn.execute(_Q_SLIP_AGGREGATES, (slip_date,)).fetchone()
+    return _summary_from_agg(agg)
 
 
-def get_payment_summary_by_date(slip_date: str) -> List[Dict[str, Any]]:
+def get_slips_and_summary(slip_date: str) -> tuple:
+    """
+    日报用：单据列表 + 当日汇总，共用一次借出的连接取回。
+    """
+    with _get_pool().borrow() as conn:
+        slips = conn.execute(_Q_SLIPS_BY_DATE, (slip_date,)).fetchall()
+        agg = conn.execute(_Q_SLIP_AGGREGATES, (slip_date,)).fetchone()
+    return slips, _summary_from_agg(agg)
+
+
+def get_payment_summary_by_date(slip_date: str) -> List[sqlite3.Row]:
     """
     某营业日的支付方式汇总 (用于首页“按支付方式统计”)
-    返回: [{'method': 'cash', 'label': '现金', 'amount': 1000}, ...]
+    返回的每行有 method / label / amount 三列（GROUP BY 在 SQL 里做完，
+    行直接给模板，不再重组成 dict）。
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT payment_method, SUM(amount) AS total_amount
-        FROM slips
-        WHERE slip_date = ?
-        GROUP BY payment_method
-        """,
-        (slip_date,),
-    )
-    rows = cur.fetchall()
-    conn.close()
-
-    # 统一所有支付方式，没记录的用 0
-    label_map = {
-        "cash": "现金",
-        "credit": "クレジットカード",
-        "wechat": "WeChat Pay",
-        "paypay": "PayPay",
-        "alipay": "支付宝",
-    }
-    result_map = {r["payment_method"]: r["total_amount"] for r in rows}
-
-    result: List[Dict[str, Any]] = []
-    for key in ["cash", "credit", "wechat", "paypay", "alipay"]:
-        result.append(
-            {
-                "method": key,
-                "label": label_map[key],
-                "amount": int(result_map.get(key, 0) or 0),
-            }
-        )
-    return result
+    return _payment_summary_cached(slip_date, _cache_versions["slips"])
+
+
+@lru_cache(maxsize=256)
+def _payment_summary_cached(slip_date: str, version: int) -> List[sqlite3.Row]:
+    with _get_pool().borrow() as conn:
+        return conn.execute(_PAYMENT_SUMMARY_SQL, (slip_date,)).fetchall()
 
 
 # ===========================
@@ -257,37 +590,11 @@ def get_food_sales(business_date: str) -> Dict[str, int]:
     """
     某一天的食物统计，没有记录时全部 0。
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT steak, beef_cube, beef_skewer, burger, sandwich, shrimp
-        FROM food_sales
-        WHERE business_date = ?
-        """,
-        (business_date,),
-    )
-    row = cur.fetchone()
-    conn.close()
-
-    if not row:
-        return {
-            "steak": 0,
-            "beef_cube": 0,
-            "beef_skewer": 0,
-            "burger": 0,
-            "sandwich": 0,
-            "shrimp": 0,
-        }
+    with _get_pool().borrow() as conn:
+        row = conn.execute(_Q_FOOD_BY_DATE, (business_date,)).fetchone()
 
-    return {
-        "steak": row["steak"] or 0,
-        "beef_cube": row["beef_cube"] or 0,
-        "beef_skewer": row["beef_skewer"] or 0,
-        "burger": row["burger"] or 0,
-        "sandwich": row["sandwich"] or 0,
-        "shrimp": row["shrimp"] or 0,
-    }
+    vals = _get_food(row) if row else (0,) * len(FOOD_COLS)
+    return dict(zip(FOOD_COLS, (v or 0 for v in vals)))
 
 
 def upsert_food_sales(
@@ -302,216 +609,186 @@ def upsert_food_sales(
     """
     有则更新，无则插入。
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO food_sales (
-            business_date, steak, beef_cube, beef_skewer, burger, sandwich, shrimp
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(business_date) DO UPDATE SET
-            steak = excluded.steak,
-            beef_cube = excluded.beef_cube,
-            beef_skewer = excluded.beef_skewer,
-            burger = excluded.burger,
-            sandwich = excluded.sandwich,
-            shrimp = excluded.shrimp
-        """,
-        (business_date, steak, beef_cube, beef_skewer, burger, sandwich, shrimp),
-    )
-    conn.commit()
-    conn.close()
+    with _get_pool().borrow(readonly=False) as conn:
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO food_sales (
+                    business_date, steak, beef_cube, beef_skewer, burger, sandwich, shrimp
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(business_date) DO UPDATE SET
+                    steak = excluded.steak,
+                    beef_cube = excluded.beef_cube,
+                    beef_skewer = excluded.beef_skewer,
+                    burger = excluded.burger,
+                    sandwich = excluded.sandwich,
+                    shrimp = excluded.shrimp
+                """,
+                (business_date, steak, beef_cube, beef_skewer, burger, sandwich, shrimp),
+            )
+    _bump_version("food_sales")
 
 
 def get_food_totals_last_days(limit: int = 7) -> Dict[str, int]:
     """
     最近 limit 天内，各食物的累计总份数。
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT
-            SUM(steak)        AS steak,
-            SUM(beef_cube)    AS beef_cube,
-            SUM(beef_skewer)  AS beef_skewer,
-            SUM(burger)       AS burger,
-            SUM(sandwich)     AS sandwich,
-            SUM(shrimp)       AS shrimp
-        FROM food_sales
-        WHERE business_date IN (
-            SELECT business_date
-            FROM food_sales
-            ORDER BY business_date DESC
-            LIMIT ?
-        )
-        """,
-        (limit,),
-    )
-    row = cur.fetchone()
-    conn.close()
-
-    if not row:
-        return {
-            "steak": 0,
-            "beef_cube": 0,
-            "beef_skewer": 0,
-            "burger": 0,
-            "sandwich": 0,
-            "shrimp": 0,
-        }
+    return _food_totals_cached(limit, _cache_versions["food_sales"])
 
-    return {
-        "steak": row["steak"] or 0,
-        "beef_cube": row["beef_cube"] or 0,
-        "beef_skewer": row["beef_skewer"] or 0,
-        "burger": row["burger"] or 0,
-        "sandwich": row["sandwich"] or 0,
-        "shrimp": row["shrimp"] or 0,
-    }
+
+@lru_cache(maxsize=256)
+def _food_totals_cached(limit: int, version: int) -> Dict[str, int]:
+    # SELECT 列序就是 FOOD_COLS 的顺序，tuple 直接 zip 回 dict；
+    # 空表的 NULL 由 SQL 里的 COALESCE 补零
+    with _get_pool().borrow() as conn:
+        with _raw_rows(conn):
+            row = conn.execute(_Q_FOOD_TOTALS, (limit,)).fetchone()
+    return dict(zip(FOOD_COLS, row))
+
+
+class DashboardData(NamedTuple):
+    """首页一屏的全部数据块。"""
+
+    slips: List[sqlite3.Row]
+    summary: Dict[str, int]
+    payments: List[sqlite3.Row]
+    food: Dict[str, int]
+    segments: List[sqlite3.Row]
+
+
+def get_dashboard(slip_date: str) -> DashboardData:
+    """
+    首页一屏的数据（单据列表 / 汇总 / 支付汇总 / 食物统计 / 时间段）
+    一次取齐。只借一次连接，五条查询连着跑，SQLite 调用开销只付一次，
+    页缓存在查询之间保持热。
+    """
+    with _get_pool().borrow() as conn:
+        slips = conn.execute(_Q_SLIPS_BY_DATE, (slip_date,)).fetchall()
+        agg = conn.execute(_Q_SLIP_AGGREGATES, (slip_date,)).fetchone()
+        pay_rows = conn.execute(_PAYMENT_SUMMARY_SQL, (slip_date,)).fetchall()
+        food_row = conn.execute(_Q_FOOD_BY_DATE, (slip_date,)).fetchone()
+        segments = conn.execute(_Q_SEGMENTS_BY_DATE, (slip_date,)).fetchall()
+
+    food_vals = _get_food(food_row) if food_row else (0,) * len(FOOD_COLS)
+    return DashboardData(
+        slips=slips,
+        summary=_summary_from_agg(agg),
+        payments=pay_rows,
+        food=dict(zip(FOOD_COLS, (v or 0 for v in food_vals))),
+        segments=segments,
+    )
 
 
 # ===========================
 # segments: 负责人时间段
 # ===========================
 def insert_segment(business_date: str, start_time: str, end_time: str, staff_name: str) -> None:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO segments (business_date, start_time, end_time, staff_name)
-        VALUES (?, ?, ?, ?)
-        """,
-        (business_date, start_time, end_time, staff_name),
-    )
-    conn.commit()
-    conn.close()
-
-
-def get_segments_by_date(business_date: str) -> List[Dict[str, Any]]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, business_date, start_time, end_time, staff_name
-        FROM segments
-        WHERE business_date = ?
-        ORDER BY start_time ASC
-        """,
-        (business_date,),
-    )
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
-
-
-def get_segment(segment_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, business_date, start_time, end_time, staff_name
-        FROM segments
-        WHERE id = ?
-        """,
-        (segment_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    with _get_pool().borrow(readonly=False) as conn:
+        with conn:
+            conn.execute(
+                _Q_INSERT_SEGMENT,
+                (business_date, start_time, end_time, staff_name),
+            )
+    _bump_version("segments")
+
+
+def insert_segments_bulk(rows: List[tuple]) -> None:
+    """
+    批量插入负责人时间段。
+    rows: [(business_date, start_time, end_time, staff_name), ...]
+    """
+    if not rows:
+        return
+    with _get_pool().borrow(readonly=False) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_Q_INSERT_SEGMENT, rows)
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    _bump_version("segments")
+
+
+def get_segments_by_date(business_date: str) -> List[sqlite3.Row]:
+    with _get_pool().borrow() as conn:
+        return conn.execute(_Q_SEGMENTS_BY_DATE, (business_date,)).fetchall()
+
+
+def get_segment(segment_id: int) -> Optional[sqlite3.Row]:
+    with _get_pool().borrow() as conn:
+        return conn.execute(_Q_SEGMENT_BY_ID, (segment_id,)).fetchone()
 
 
 def update_segment(segment_id: int, start_time: str, end_time: str, staff_name: str) -> None:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE segments
-        SET start_time = ?, end_time = ?, staff_name = ?
-        WHERE id = ?
-        """,
-        (start_time, end_time, staff_name, segment_id),
-    )
-    conn.commit()
-    conn.close()
+    with _get_pool().borrow(readonly=False) as conn:
+        with conn:
+            conn.execute(
+                """
+                UPDATE segments
+                SET start_time = ?, end_time = ?, staff_name = ?
+                WHERE id = ?
+                """,
+                (start_time, end_time, staff_name, segment_id),
+            )
+    _bump_version("segments")
 
 
 def delete_segment(segment_id: int) -> None:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
-    conn.commit()
-    conn.close()
+    with _get_pool().borrow(readonly=False) as conn:
+        with conn:
+            conn.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+    _bump_version("segments")
 
 
 # ===========================
 # Performance: 趋势分析
 # ===========================
-def get_daily_sales_and_customers(limit: int = 7) -> List[Dict[str, Any]]:
+def get_daily_sales_and_customers(limit: int = 7) -> List[sqlite3.Row]:
     """
     最近 limit 天 每日的营业额 & 客数。
     返回时按日期升序（方便画折线图）。
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT slip_date,
-               SUM(amount) AS total_sales,
-               SUM(people) AS total_customers
-        FROM slips
-        GROUP BY slip_date
-        ORDER BY slip_date DESC
-        LIMIT ?
-        """,
-        (limit,),
-    )
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
+    return _daily_sales_cached(limit, _cache_versions["slips"])
 
-    rows.reverse()
-    return rows
+
+@lru_cache(maxsize=16)
+def _daily_sales_cached(limit: int, version: int) -> List[sqlite3.Row]:
+    with _get_pool().borrow() as conn:
+        return conn.execute(_Q_DAILY_SALES, (limit,)).fetchall()
 
 
 # ===========================
 # users: 登录用户
 # ===========================
 def create_user(username: str, password_hash: str, created_at: str) -> None:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO users (username, password_hash, created_at)
-        VALUES (?, ?, ?)
-        """,
-        (username, password_hash, created_at),
-    )
-    conn.commit()
-    conn.close()
+    with _get_pool().borrow(readonly=False) as conn:
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO users (username, password_hash, created_at)
+                VALUES (?, ?, ?)
+                """,
+                (username, password_hash, created_at),
+            )
 
 
 def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT * FROM users WHERE username = ?",
-        (username,),
-    )
-    row = cur.fetchone()
-    conn.close()
+    with _get_pool().borrow() as conn:
+        row = conn.execute(
+            "SELECT * FROM users WHERE username = ?",
+            (username,),
+        ).fetchone()
     return dict(row) if row else None
 
 
 def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT * FROM users WHERE id = ?",
-        (user_id,),
-    )
-    row = cur.fetchone()
-    conn.close()
+    with _get_pool().borrow() as conn:
+        row = conn.execute(
+            "SELECT * FROM users WHERE id = ?",
+            (user_id,),
+        ).fetchone()
     return dict(row) if row else None
 
 
@@ -521,45 +798,45 @@ def ensure_default_users() -> None:
       - 正常账号：coffee01 / tabako01
       - 后门账号：backup99 / reset99
     """
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute("SELECT COUNT(*) AS c FROM users")
-    row = cur.fetchone()
-    count = row["c"] if row else 0
-
-    if count == 0:
-        now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-        # 正常账号
-        cur.execute(
-            """
-            INSERT INTO users (username, password_hash, created_at)
-            VALUES (?, ?, ?)
-            """,
-            (
-                "coffee01",
-                generate_password_hash("tabako01"),
-                now_str,
-            ),
-        )
-
-        # 后门账号
-        cur.execute(
-            """
-            INSERT INTO users (username, password_hash, created_at)
-            VALUES (?, ?, ?)
-            """,
-            (
-                "backup99",
-                generate_password_hash("reset99"),
-                now_str,
-            ),
-        )
-
-        conn.commit()
-
-    conn.close()
+    with _get_pool().borrow(readonly=False) as conn:
+        cur = conn.cursor()
+
+        cur.execute("SELECT COUNT(*) AS c FROM users")
+        row = cur.fetchone()
+        count = row["c"] if row else 0
+
+        if count == 0:
+            now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
+
+            conn.execute("BEGIN")
+
+            # 正常账号
+            cur.execute(
+                """
+                INSERT INTO users (username, password_hash, created_at)
+                VALUES (?, ?, ?)
+                """,
+                (
+                    "coffee01",
+                    generate_password_hash("tabako01"),
+                    now_str,
+                ),
+            )
+
+            # 后门账号
+            cur.execute(
+                """
+                INSERT INTO users (username, password_hash, created_at)
+                VALUES (?, ?, ?)
+                """,
+                (
+                    "backup99",
+                    generate_password_hash("reset99"),
+                    now_str,
+                ),
+            )
+
+            conn.commit()
 
 
 # ===========================
@@ -570,10 +847,20 @@ def clear_all_business_data() -> None:
     删除所有营业数据：单据、食物统计、负责人时间段。
     不删除 users 表里的账号。
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM slips")
-    cur.execute("DELETE FROM food_sales")
-    cur.execute("DELETE FROM segments")
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    with _get_pool().borrow(readonly=False) as conn:
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DELETE FROM slips")
+            conn.execute("DELETE FROM food_sales")
+            conn.execute("DELETE FROM segments")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        # 大量删除之后回收空间并刷新统计信息，
+        # 避免查询计划器拿着过期的选择率做决定
+        conn.execute("VACUUM")
+        conn.execute("ANALYZE")
+    _bump_version("slips")
+    _bump_version("food_sales")
+    _bump_version("segments")
@@ -0,0 +1,6 @@
+# gunicorn.conf.py
+# 从本目录启动 gunicorn 时会自动读取。
+# 请求的耗时都在阻塞的 SQLite 调用和模板渲染上，给每个 worker
+# 配一组线程，慢请求（比如 CSV 导出）不会把整个 worker 占死，
+# 并发能力随线程数扩展。
+threads = 8
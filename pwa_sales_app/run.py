@@ -1,7 +1,11 @@
 # run.py
+import tempfile
+from pathlib import Path
+
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
 from views.main_views import main_bp
-from database.db import init_db, ensure_default_users
+from database.db import init_db, ensure_default_users, warmup
 
 
 def create_app() -> Flask:
@@ -14,12 +18,27 @@ def create_app() -> Flask:
     # session 用 secret key（可以以后放到环境变量）
     app.secret_key = "change_me_to_a_random_secret_key_2025"
 
+    # 模板字节码缓存：编译结果落盘，worker 重启后直接复用，
+    # 不用再把每个模板重新编译一遍
+    cache_dir = Path(tempfile.gettempdir()) / "pwa_sales_jinja_cache"
+    cache_dir.mkdir(exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(cache_dir))
+
+    # 模板部署后不会变，明确关掉 auto_reload，
+    # 请求路径上不再对模板文件做 stat / 重编译检查
+    # （蓝图注册时的 record_once 钩子会把全部模板预编译好）
+    app.config["TEMPLATES_AUTO_RELOAD"] = False
+    app.jinja_env.auto_reload = False
+
     # DB 初期化（建表）
     init_db()
 
     # 用户初始化（若无用户，创建默认账号和后门账号）
     ensure_default_users()
 
+    # 预热：启动时把业务表扫进页缓存，首个请求不吃冷盘 I/O
+    warmup()
+
     # Blueprint 登録
     app.register_blueprint(main_bp)
 
@@ -1,24 +1,36 @@
 # views/main_views.py
+import gzip
+import hashlib
+import hmac
+import logging
+import queue
+import re
+import threading
+import time
 from datetime import datetime, date
-from typing import Dict, List, Optional
-import csv
-from io import StringIO
+from io import BytesIO
+from time import monotonic
+from typing import Any, Dict, Optional, Tuple
 
 from flask import (
     Blueprint,
+    Response,
+    current_app,
     render_template,
     request,
     redirect,
     url_for,
     make_response,
     session,
+    stream_with_context,
 )
 
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 
 from database.db import (
-    get_slips_by_date,
+    FOOD_COLS,
+    get_slips_and_summary,
     get_slip,
     insert_slip,
     update_slip,
@@ -26,6 +38,7 @@ from database.db import (
     get_recent_dates,
     get_payment_summary_by_date,
     get_food_sales,
+    get_dashboard,
     upsert_food_sales,
     get_daily_sales_and_customers,
     get_food_totals_last_days,
@@ -34,7 +47,8 @@ from database.db import (
     get_segment,
     update_segment,
     delete_segment,
-    get_all_slips,
+    get_slips_fingerprint,
+    iter_slips_for_export,
     create_user,
     get_user_by_username,
     clear_all_business_data,
@@ -43,6 +57,265 @@ from database.db import (
 main_bp = Blueprint("main", __name__)
 
 
+# 营业日参数的形状校验：strptime 解析整个 struct_tm 太重，
+# 定长格式用预编译正则就够了
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def _requested_date() -> str:
+    """query string / 表单里的营业日，不是 YYYY-MM-DD 就退回今天。"""
+    raw = request.args.get("date") or request.form.get("business_date") or ""
+    return raw if _DATE_RE.match(raw) else _today_str()
+
+
+def _parse_int(raw: Optional[str]) -> int:
+    """
+    表单整数解析：空/非法输入当 0，不走异常机制。
+    守卫用 isdecimal 而不是 isdigit——isdigit 会放过上标数字等
+    int() 不认的字符；isdecimal 恰好等于 int() 接受的数字集合。
+    """
+    raw = (raw or "").strip()
+    if not raw:
+        return 0
+    body = raw[1:] if raw[0] in "+-" else raw
+    return int(raw) if body.isdecimal() else 0
+
+
+def _today_str() -> str:
+    """今天的 YYYY-MM-DD。isoformat 是 C 实现的专用路径，比 strftime 快。"""
+    return date.today().isoformat()
+
+
+def _now_str() -> str:
+    """当前时刻的 YYYY-MM-DD HH:MM。isoformat 整段在 C 里完成，最快。"""
+    return datetime.now().isoformat(sep=" ", timespec="minutes")
+
+
+# 一次 yield 的行数：太小 WSGI chunk 开销大，太大失去流式意义
+_CSV_BATCH_ROWS = 500
+
+# 导出 CSV 的表头行是不变的，预先拼好，不在每次请求里重建列表
+_EXPORT_CSV_HEADER = "ID,营业日,桌号,人数,金额(日元),支付方式,记录时间\r\n"
+
+
+def _csv_escape(value: Any) -> str:
+    """只有含 逗号/引号/换行 的字段才加引号，其余原样输出。"""
+    s = str(value)
+    if any(c in s for c in ',"\n\r'):
+        return '"' + s.replace('"', '""') + '"'
+    return s
+
+# 食物的 (key, 中文名) 骨架是常量，只在这里建一次；
+# 各视图请求时仅按 key 填 quantity
+_FOOD_SKELETON = (
+    ("steak", "牛排"),
+    ("beef_cube", "牛肉粒"),
+    ("beef_skewer", "牛肉串"),
+    ("burger", "汉堡"),
+    ("sandwich", "三明治"),
+    ("shrimp", "虾"),
+)
+
+
+# 标签常量一次性注入所有模板上下文，模板直接 zip 数量，
+# 视图不再按请求拼 food_items 列表
+@main_bp.app_context_processor
+def _inject_constants() -> Dict[str, Any]:
+    return {"FOOD_LABELS": _FOOD_SKELETON}
+
+
+# ===========================
+# 模板对象缓存
+# ===========================
+# render_template 每次都要过一遍 Jinja loader 的查找/选择逻辑，
+# 这里在蓝图注册时把全部模板编译好存进模块字典，之后直接 render。
+_TEMPLATES: Dict[str, Any] = {}
+
+_TEMPLATE_NAMES = (
+    "index.html",
+    "input.html",
+    "edit.html",
+    "report.html",
+    "food.html",
+    "edit_segment.html",
+    "performance.html",
+    "settings.html",
+    "login.html",
+    "register.html",
+)
+
+
+@main_bp.record_once
+def _load_templates(state) -> None:
+    env = state.app.jinja_env
+    for name in _TEMPLATE_NAMES:
+        _TEMPLATES[name] = env.get_template(name)
+
+
+def _render(template_name: str, **context: Any):
+    template = _TEMPLATES.get(template_name)
+    if template is None:
+        # 蓝图还没注册到 app 上（少见）就退回普通路径
+        return render_template(template_name, **context)
+    # 补上 render_template 会注入的 request/session/g 等上下文
+    current_app.update_template_context(context)
+    return make_response(template.render(**context))
+
+
+def _render_stream(template_name: str, **context: Any):
+    """
+    流式渲染：模板一边求值一边往外发，不等整页字符串拼完。
+    日报的单据表很长时能明显压低峰值内存、提前首字节。
+    """
+    template = _TEMPLATES.get(template_name)
+    if template is None:
+        return render_template(template_name, **context)
+    current_app.update_template_context(context)
+    stream = template.stream(**context)
+    stream.enable_buffering(10)
+    return current_app.response_class(stream_with_context(stream))
+
+
+# ===========================
+# 查询结果 TTL 缓存
+# ===========================
+# 首页一分钟内往往被刷新很多次而数据没变，给按营业日的读查询
+# 加一层 (函数名, 营业日) -> 结果 的小缓存。今天的数据 30 秒过期；
+# 过去的营业日不会再变，给一个长得多的 TTL。写入路径按营业日
+# 整体失效，所以提交单据后刷新立即能看到新数据（改历史日期也一样）。
+_QUERY_TTL = 30.0
+_QUERY_TTL_PAST = 3600.0
+_QUERY_CACHE_MAX = 64
+_query_cache: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+_query_cache_lock = threading.Lock()
+
+
+def _cached_by_date(fn):
+    """把单参数 loader(slip_date) 包上 TTL 缓存。"""
+    name = fn.__name__
+
+    @wraps(fn)
+    def wrapped(slip_date: str):
+        key = (name, slip_date)
+        now = monotonic()
+        with _query_cache_lock:
+            hit = _query_cache.get(key)
+            if hit is not None and hit[0] > now:
+                return hit[1]
+        value = fn(slip_date)
+        ttl = _QUERY_TTL if slip_date >= _today_str() else _QUERY_TTL_PAST
+        with _query_cache_lock:
+            if len(_query_cache) >= _QUERY_CACHE_MAX:
+                _query_cache.clear()
+            _query_cache[key] = (now + ttl, value)
+        return value
+
+    return wrapped
+
+
+def _invalidate_date(slip_date: str) -> None:
+    """写入某营业日的数据后，丢掉该日的全部缓存条目并更新修改时间。"""
+    with _query_cache_lock:
+        for key in [k for k in _query_cache if k[1] == slip_date]:
+            del _query_cache[key]
+    now_ns = time.time_ns()
+    _LAST_MOD[slip_date] = now_ns
+    _LAST_MOD["*"] = now_ns
+
+
+# ===========================
+# 条件请求（ETag / 304）
+# ===========================
+# PWA 会反复轮询 / 和 /report。按营业日记录最后写入时间戳拼成弱
+# ETag：内容没变时直接 304，连查询带渲染全部跳过。"*" 是全局键，
+# 给跨日期的 /performance 用。没写过的键用进程默认值兜底，清空
+# 数据时只要把默认值往前推，所有旧 ETag 即刻失效。
+_LAST_MOD: Dict[str, int] = {}
+_default_mod = time.time_ns()
+
+
+def _etag_for(key: str) -> str:
+    return f"{key}-{_LAST_MOD.get(key, _default_mod)}"
+
+
+def _etag_with_global(key: str) -> str:
+    """带上 "*" 键的 ETag：给还嵌入跨日期数据（如最近营业日导航）
+    的页面用，任何一天有写入都会让它失效。"""
+    return f"{_etag_for(key)}-{_LAST_MOD.get('*', _default_mod)}"
+
+
+def _not_modified(etag: str, weak: bool = True) -> Response:
+    """304 响应也按 RFC 9110 带上 ETag 头。"""
+    resp = Response(status=304)
+    resp.set_etag(etag, weak=weak)
+    return resp
+
+
+_cached_slips_and_summary = _cached_by_date(get_slips_and_summary)
+_cached_dashboard = _cached_by_date(get_dashboard)
+
+
+# ===========================
+# 后台写队列
+# ===========================
+# 写端点的响应时间基本等于 SQLite 的 fsync 时间。不需要返回值的
+# 写操作丢进单线程后台 worker（SQLite 本来就是单写者），请求线程
+# 只入队然后跳转。缓存失效放在 worker 落库之后做；视图对自己的写
+# 最多等 250ms，通常足够写完，跳回首页就能看到新数据。
+_logger = logging.getLogger(__name__)
+
+_WRITE_QUEUE: "queue.Queue" = queue.Queue()
+
+
+def _write_worker() -> None:
+    while True:
+        fn, args, kwargs, slip_date, done = _WRITE_QUEUE.get()
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            _logger.exception("后台写入失败: %s%r", fn.__name__, args)
+        finally:
+            _invalidate_date(slip_date)
+            done.set()
+            _WRITE_QUEUE.task_done()
+
+
+threading.Thread(target=_write_worker, name="db-writer", daemon=True).start()
+
+
+def _enqueue_write(fn, slip_date: str, *args: Any, **kwargs: Any) -> None:
+    done = threading.Event()
+    _WRITE_QUEUE.put((fn, args, kwargs, slip_date, done))
+    done.wait(0.25)
+
+
+# ===========================
+# 密码校验缓存
+# ===========================
+# PBKDF2 校验是登录 POST 的主要 CPU 开销（几十毫秒量级）。
+# 同一账号短时间内重复登录时直接复用上次结果：按 password_hash 存
+# (过期时间, 密码的 keyed-blake2b 摘要, 结果)，明文不进内存，
+# 摘要比较用 hmac.compare_digest 保持恒定时间。
+_PW_CACHE_TTL = 300.0
+_pw_cache: Dict[str, Tuple[float, str, bool]] = {}
+_pw_cache_lock = threading.Lock()
+
+
+def _check_password_cached(password_hash: str, password: str) -> bool:
+    digest = hashlib.blake2b(
+        password.encode(), key=current_app.secret_key.encode()
+    ).hexdigest()
+    now = monotonic()
+    with _pw_cache_lock:
+        hit = _pw_cache.get(password_hash)
+    if hit is not None and hit[0] > now and hmac.compare_digest(hit[1], digest):
+        return hit[2]
+    ok = check_password_hash(password_hash, password)
+    with _pw_cache_lock:
+        _pw_cache[password_hash] = (now + _PW_CACHE_TTL, digest, ok)
+    return ok
+
+
 # ===========================
 # 登录保护装饰器
 # ===========================
@@ -60,68 +333,34 @@ def login_required(view_func):
     return wrapped
 
 
-# ===========================
-# 共用：统计用汇总函数
-# ===========================
-def calculate_summary(slips: List[Dict]) -> Dict[str, int]:
-    total_sales = sum(slip["amount"] for slip in slips)
-    total_customers = sum(slip["people"] for slip in slips)
-    total_tables = len(slips)
-
-    avg_per_customer = int(total_sales / total_customers) if total_customers else 0
-
-    return {
-        "total_sales": total_sales,
-        "total_customers": total_customers,
-        "total_tables": total_tables,
-        "avg_per_customer": avg_per_customer,
-    }
-
-
 # ===========================
 # 首页
 # ===========================
 @main_bp.route("/")
 @login_required
 def index():
-    # 营业日：query string 中没有就用今天
-    business_date = request.args.get("date") or date.today().strftime("%Y-%m-%d")
+    # 营业日：query string 里没有（或不合法）就用今天
+    business_date = _requested_date()
 
-    slips = get_slips_by_date(business_date)
-    summary = calculate_summary(slips)
+    etag = _etag_for(business_date)
+    if request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
 
-    # 时间字段只取 HH:MM
-    for slip in slips:
-        created_at = slip.get("created_at")
-        slip["time"] = created_at[11:16] if created_at and len(created_at) >= 16 else ""
+    # 整屏数据一次连接取回：单据、汇总、支付、食物、时间段
+    dashboard = _cached_dashboard(business_date)
 
-    # 支付方式汇总
-    payment_summary = get_payment_summary_by_date(business_date)
-
-    # 食物贩卖
-    food_raw = get_food_sales(business_date) or {}
-    food_items = [
-        {"key": "steak",       "label": "牛排",   "quantity": food_raw.get("steak", 0)},
-        {"key": "beef_cube",   "label": "牛肉粒", "quantity": food_raw.get("beef_cube", 0)},
-        {"key": "beef_skewer", "label": "牛肉串", "quantity": food_raw.get("beef_skewer", 0)},
-        {"key": "burger",      "label": "汉堡",   "quantity": food_raw.get("burger", 0)},
-        {"key": "sandwich",    "label": "三明治", "quantity": food_raw.get("sandwich", 0)},
-        {"key": "shrimp",      "label": "虾",     "quantity": food_raw.get("shrimp", 0)},
-    ]
-
-    # 负责人时间段
-    segments = get_segments_by_date(business_date)
-
-    return render_template(
+    resp = _render(
         "index.html",
         active_tab="home",
         business_date=business_date,
-        summary=summary,
-        slips=slips,
-        payment_summary=payment_summary,
-        food_items=food_items,
-        segments=segments,
+        summary=dashboard.summary,
+        slips=dashboard.slips,
+        payment_summary=dashboard.payments,
+        food=dashboard.food,
+        segments=dashboard.segments,
     )
+    resp.set_etag(etag, weak=True)
+    return resp
 
 
 # ===========================
@@ -131,43 +370,33 @@ def index():
 @login_required
 def input_slip():
     # 优先： query string -> form.hidden -> 今天
-    business_date = (
-        request.args.get("date")
-        or request.form.get("business_date")
-        or date.today().strftime("%Y-%m-%d")
-    )
+    business_date = _requested_date()
 
     if request.method == "POST":
-        table_raw = request.form.get("table", "").strip()
-        people_raw = request.form.get("people", "").strip()
-        amount_raw = request.form.get("amount", "").strip()
+        table_name: Optional[str] = request.form.get("table", "").strip() or None
+        people = _parse_int(request.form.get("people"))
+        amount = _parse_int(request.form.get("amount"))
         payment_method = request.form.get("payment_method") or "cash"
 
-        table_name: Optional[str] = table_raw or None
-        try:
-            people = int(people_raw)
-        except ValueError:
-            people = 0
-        try:
-            amount = int(amount_raw)
-        except ValueError:
-            amount = 0
+        now_str = _now_str()
 
-        now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-        insert_slip(
-            slip_date=business_date,
-            table_name=table_name,
-            people=people,
-            amount=amount,
-            payment_method=payment_method,
-            created_at=now_str,
+        # 参数全部按位置传：slip_date= 等关键字会撞上
+        # _enqueue_write 自己的形参
+        _enqueue_write(
+            insert_slip,
+            business_date,
+            business_date,
+            table_name,
+            people,
+            amount,
+            payment_method,
+            now_str,
         )
 
         return redirect(url_for("main.index", date=business_date))
 
     # GET: 显示表单
-    return render_template(
+    return _render(
         "input.html",
         active_tab="input",
         business_date=business_date,
@@ -180,41 +409,31 @@ def input_slip():
 @main_bp.route("/slips/<int:slip_id>/edit", methods=["GET", "POST"])
 @login_required
 def edit_slip_view(slip_id: int):
-    slip = get_slip(slip_id)
-    if not slip:
-        return redirect(url_for("main.index"))
-
-    business_date = slip["slip_date"]
-
     if request.method == "POST":
-        table_raw = request.form.get("table", "").strip()
-        people_raw = request.form.get("people", "").strip()
-        amount_raw = request.form.get("amount", "").strip()
-        # 目前 edit 页面没有支付方式选项，先用原来的
-        payment_method = slip["payment_method"]
+        table_name: Optional[str] = request.form.get("table", "").strip() or None
+        people = _parse_int(request.form.get("people"))
+        amount = _parse_int(request.form.get("amount"))
 
-        table_name: Optional[str] = table_raw or None
-        try:
-            people = int(people_raw)
-        except ValueError:
-            people = 0
-        try:
-            amount = int(amount_raw)
-        except ValueError:
-            amount = 0
-
-        update_slip(
+        # 一条 UPDATE ... RETURNING 同时完成修改和取营业日，
+        # 不用先 get_slip 再改；支付方式 edit 页没有选项，保持原值
+        business_date = update_slip(
             slip_id=slip_id,
             table_name=table_name,
             people=people,
             amount=amount,
-            payment_method=payment_method,
         )
+        if business_date is None:
+            return redirect(url_for("main.index"))
+        _invalidate_date(business_date)
 
         return redirect(url_for("main.index", date=business_date))
 
     # GET
-    return render_template(
+    slip = get_slip(slip_id)
+    if not slip:
+        return redirect(url_for("main.index"))
+
+    return _render(
         "edit.html",
         slip=slip,
         active_tab="home",
@@ -224,10 +443,11 @@ def edit_slip_view(slip_id: int):
 @main_bp.route("/slips/<int:slip_id>/delete", methods=["POST"])
 @login_required
 def delete_slip_view(slip_id: int):
-    slip = get_slip(slip_id)
-    if slip:
-        business_date = slip["slip_date"]
-        delete_slip(slip_id)
+    # DELETE ... RETURNING 给出营业日；单据已被删（重复提交）时
+    # 退回表单里带的 slip_date，仍能跳回正确的日期页
+    business_date = delete_slip(slip_id) or request.form.get("slip_date")
+    if business_date:
+        _invalidate_date(business_date)
         return redirect(url_for("main.index", date=business_date))
     return redirect(url_for("main.index"))
 
@@ -238,41 +458,36 @@ def delete_slip_view(slip_id: int):
 @main_bp.route("/report")
 @login_required
 def report():
-    business_date = request.args.get("date") or date.today().strftime("%Y-%m-%d")
-    slips = get_slips_by_date(business_date)
+    business_date = _requested_date()
 
-    # 给日报用的 time 字段
-    for slip in slips:
-        created_at = slip.get("created_at")
-        slip["time"] = created_at[11:16] if created_at and len(created_at) >= 16 else ""
+    # 页面还嵌入跨日期的最近营业日导航，ETag 要叠加全局键，
+    # 否则别的日期新增单据后本页会一直 304，导航永远不更新
+    etag = _etag_with_global(business_date)
+    if request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
+
+    slips, summary = _cached_slips_and_summary(business_date)
 
-    summary = calculate_summary(slips)
     payment_summary = get_payment_summary_by_date(business_date)
 
-    food_raw = get_food_sales(business_date) or {}
-    food_items = [
-        {"label": "牛排",   "quantity": food_raw.get("steak", 0)},
-        {"label": "牛肉粒", "quantity": food_raw.get("beef_cube", 0)},
-        {"label": "牛肉串", "quantity": food_raw.get("beef_skewer", 0)},
-        {"label": "汉堡",   "quantity": food_raw.get("burger", 0)},
-        {"label": "三明治", "quantity": food_raw.get("sandwich", 0)},
-        {"label": "虾",     "quantity": food_raw.get("shrimp", 0)},
-    ]
+    food = get_food_sales(business_date) or {}
 
     segments = get_segments_by_date(business_date)
     recent_dates = get_recent_dates(limit=7)
 
-    return render_template(
+    resp = _render_stream(
         "report.html",
         active_tab="report",
         slip_date=business_date,
         summary=summary,
         slips=slips,
         payment_summary=payment_summary,
-        food_items=food_items,
+        food=food,
         segments=segments,
         recent_dates=recent_dates,
     )
+    resp.set_etag(etag, weak=True)
+    return resp
 
 
 # ===========================
@@ -281,55 +496,21 @@ def report():
 @main_bp.route("/food/edit", methods=["GET", "POST"])
 @login_required
 def edit_food_sales():
-    business_date = (
-        request.args.get("date")
-        or request.form.get("business_date")
-        or date.today().strftime("%Y-%m-%d")
-    )
+    business_date = _requested_date()
 
     if request.method == "POST":
-
-        def parse_int(name: str) -> int:
-            raw = request.form.get(name, "").strip()
-            try:
-                return int(raw)
-            except ValueError:
-                return 0
-
-        steak = parse_int("steak")
-        beef_cube = parse_int("beef_cube")
-        beef_skewer = parse_int("beef_skewer")
-        burger = parse_int("burger")
-        sandwich = parse_int("sandwich")
-        shrimp = parse_int("shrimp")
-
-        upsert_food_sales(
-            business_date,
-            steak,
-            beef_cube,
-            beef_skewer,
-            burger,
-            sandwich,
-            shrimp,
-        )
+        quantities = {key: _parse_int(request.form.get(key)) for key in FOOD_COLS}
+        _enqueue_write(upsert_food_sales, business_date, business_date, **quantities)
         return redirect(url_for("main.index", date=business_date))
 
     # GET
-    food_raw = get_food_sales(business_date) or {}
-    items = [
-        {"key": "steak",       "label": "牛排",   "quantity": food_raw.get("steak", 0)},
-        {"key": "beef_cube",   "label": "牛肉粒", "quantity": food_raw.get("beef_cube", 0)},
-        {"key": "beef_skewer", "label": "牛肉串", "quantity": food_raw.get("beef_skewer", 0)},
-        {"key": "burger",      "label": "汉堡",   "quantity": food_raw.get("burger", 0)},
-        {"key": "sandwich",    "label": "三明治", "quantity": food_raw.get("sandwich", 0)},
-        {"key": "shrimp",      "label": "虾",     "quantity": food_raw.get("shrimp", 0)},
-    ]
-
-    return render_template(
+    food = get_food_sales(business_date) or {}
+
+    return _render(
         "food.html",
         active_tab="home",
         business_date=business_date,
-        items=items,
+        food=food,
     )
 
 
@@ -339,13 +520,15 @@ def edit_food_sales():
 @main_bp.route("/segments/add", methods=["POST"])
 @login_required
 def add_segment():
-    business_date = request.form.get("business_date") or date.today().strftime("%Y-%m-%d")
+    business_date = _requested_date()
     start_time = request.form.get("start_time", "").strip()
     end_time = request.form.get("end_time", "").strip()
     staff_name = request.form.get("staff_name", "").strip()
 
     if start_time and end_time and staff_name:
-        insert_segment(business_date, start_time, end_time, staff_name)
+        _enqueue_write(
+            insert_segment, business_date, business_date, start_time, end_time, staff_name
+        )
 
     return redirect(url_for("main.index", date=business_date))
 
@@ -361,10 +544,12 @@ def edit_segment_view(segment_id: int):
         start_time = request.form.get("start_time", "").strip()
         end_time = request.form.get("end_time", "").strip()
         staff_name = request.form.get("staff_name", "").strip()
-        update_segment(segment_id, start_time, end_time, staff_name)
+        _enqueue_write(
+            update_segment, seg["business_date"], segment_id, start_time, end_time, staff_name
+        )
         return redirect(url_for("main.index", date=seg["business_date"]))
 
-    return render_template(
+    return _render(
         "edit_segment.html",
         segment=seg,
         active_tab="home",
@@ -376,7 +561,7 @@ def edit_segment_view(segment_id: int):
 def delete_segment_view(segment_id: int):
     seg = get_segment(segment_id)
     if seg:
-        delete_segment(segment_id)
+        _enqueue_write(delete_segment, seg["business_date"], segment_id)
         return redirect(url_for("main.index", date=seg["business_date"]))
     return redirect(url_for("main.index"))
 
@@ -387,32 +572,20 @@ def delete_segment_view(segment_id: int):
 @main_bp.route("/performance")
 @login_required
 def performance():
-    daily_stats = get_daily_sales_and_customers(limit=7)
-
-    line_labels = [d["slip_date"] for d in daily_stats]
-    line_sales = [d["total_sales"] for d in daily_stats]
-    line_customers = [d["total_customers"] for d in daily_stats]
-
-    food_totals = get_food_totals_last_days(limit=7)
-    bar_labels = ["牛排", "牛肉粒", "牛肉串", "汉堡", "三明治", "虾"]
-    bar_values = [
-        food_totals.get("steak", 0),
-        food_totals.get("beef_cube", 0),
-        food_totals.get("beef_skewer", 0),
-        food_totals.get("burger", 0),
-        food_totals.get("sandwich", 0),
-        food_totals.get("shrimp", 0),
-    ]
-
-    return render_template(
+    etag = _etag_for("*")
+    if request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
+
+    # 原始行直接进模板，图表数组用 Jinja 的 map/tojson 现场生成，
+    # 不在视图里再做三遍 O(N) 列表推导
+    resp = _render(
         "performance.html",
         active_tab="performance",
-        line_labels=line_labels,
-        line_sales=line_sales,
-        line_customers=line_customers,
-        bar_labels=bar_labels,
-        bar_values=bar_values,
+        daily_stats=get_daily_sales_and_customers(limit=7),
+        food_totals=get_food_totals_last_days(limit=7),
     )
+    resp.set_etag(etag, weak=True)
+    return resp
 
 
 # ===========================
@@ -422,7 +595,7 @@ def performance():
 @login_required
 def settings():
     cleared = request.args.get("cleared") == "1"
-    return render_template(
+    return _render(
         "settings.html",
         active_tab="settings",
         cleared=cleared,
@@ -439,56 +612,75 @@ def export_data_csv():
     """
     导出所有单据数据为 CSV 文件（明细）
     """
-    slips_data = get_all_slips()
-
-    # 1. CSV 头
-    header = [
-        "ID",
-        "营业日",
-        "桌号",
-        "人数",
-        "金额(日元)",
-        "支付方式",
-        "记录时间",
-    ]
-
-    rows = []
-    payment_map = {
-        "cash": "现金",
-        "credit": "クレジットカード",
-        "wechat": "WeChat Pay",
-        "paypay": "PayPay",
-        "alipay": "支付宝",
-    }
-
-    for slip in slips_data:
-        payment_label = payment_map.get(slip["payment_method"], slip["payment_method"])
-
-        rows.append(
-            [
-                slip["id"],
-                slip["slip_date"],
-                slip["table_name"] or "",
-                slip["people"],
-                slip["amount"],
-                payment_label,
-                slip["created_at"],
-            ]
+    # 导出内容由 slips 表唯一决定：表没变时直接 304，不重新生成
+    max_rowid, row_count, version = get_slips_fingerprint()
+    etag = f"{max_rowid}-{row_count}-{version}"
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag, weak=False)
+
+    # 一条单据都没有：指纹里已经带了行数，直接回表头，
+    # 不再开导出游标、不走 gzip 流水线
+    if row_count == 0:
+        resp = Response(
+            ("\ufeff" + _EXPORT_CSV_HEADER).encode("utf-8"),
+            mimetype="text/csv; charset=utf-8",
         )
-
-    si = StringIO()
-    cw = csv.writer(si)
-    cw.writerow(header)
-    cw.writerows(rows)
-
-    output = make_response(si.getvalue())
-    current_date = date.today().strftime("%Y%m%d")
-    filename = f"sales_export_{current_date}.csv"
-
-    output.headers["Content-Disposition"] = f"attachment; filename={filename}"
-    output.headers["Content-type"] = "text/csv; charset=utf-8"
-
-    return output
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, must-revalidate"
+        return resp
+
+    def generate():
+        # 大部分列是受控格式（整数/ISO 日期），手工 f-string 拼行
+        # 比 csv.writer 每格回调 Python 做引号判断省一半指令；
+        # 桌号来自表单、支付方式走 CASE 的 ELSE 分支时也是表单原值，
+        # 这两列都过 _csv_escape（几乎不触发引号分支，开销可忽略）。
+        # 按批 yield，整张表自始至终不在内存里。
+        # 整批一次 encode 成 bytes，Werkzeug 不再逐块转码；
+        # 首块带 UTF-8 BOM，Excel 才按 UTF-8 识别中文表头
+        rows = ["\ufeff" + _EXPORT_CSV_HEADER]
+        for sid, sdate, table, people, amount, label, created in iter_slips_for_export():
+            rows.append(
+                f"{sid},{sdate},{_csv_escape(table)},{people},{amount},"
+                f"{_csv_escape(label)},{created}\r\n"
+            )
+            if len(rows) >= _CSV_BATCH_ROWS:
+                yield "".join(rows).encode("utf-8")
+                rows = []
+        if rows:
+            yield "".join(rows).encode("utf-8")
+
+    def generate_gz():
+        # CSV 里全是重复的日期/枚举串，level 1 的 gzip 就能压掉绝大半
+        # 流量，CPU 开销很小。逐批 flush，保持流式输出
+        out = BytesIO()
+        gz = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=1)
+        for chunk in generate():
+            gz.write(chunk)
+            gz.flush()
+            if out.tell():
+                yield out.getvalue()
+                out.seek(0)
+                out.truncate()
+        gz.close()
+        if out.tell():
+            yield out.getvalue()
+
+    filename = f"sales_export_{date.today().strftime('%Y%m%d')}.csv"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if "gzip" in request.accept_encodings:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+        body = generate_gz()
+    else:
+        body = generate()
+    resp = current_app.response_class(
+        stream_with_context(body),
+        mimetype="text/csv; charset=utf-8",
+        headers=headers,
+    )
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, must-revalidate"
+    return resp
 
 
 # ===========================
@@ -497,7 +689,14 @@ def export_data_csv():
 @main_bp.route("/clear-data", methods=["POST"])
 @login_required
 def clear_data_view():
+    global _default_mod
+
     clear_all_business_data()
+    with _query_cache_lock:
+        _query_cache.clear()
+    # 所有营业日的内容都变了：清掉时间戳并前移默认值，旧 ETag 全部失效
+    _LAST_MOD.clear()
+    _default_mod = time.time_ns()
     return redirect(url_for("main.settings", cleared="1"))
 
 
@@ -519,7 +718,7 @@ def login():
 
         user = get_user_by_username(username)
 
-        if not user or not check_password_hash(user["password_hash"], password):
+        if not user or not _check_password_cached(user["password_hash"], password):
             error = "账号或密码错误"
         else:
             # 登录成功
@@ -527,7 +726,7 @@ def login():
             session["username"] = user["username"]
             return redirect(next_url)
 
-    return render_template(
+    return _render(
         "login.html",
         error=error,
         next_url=next_url,
@@ -559,7 +758,7 @@ def register():
             error = "该账号已存在"
         else:
             pw_hash = generate_password_hash(password)
-            now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
+            now_str = _now_str()
             create_user(username, pw_hash, now_str)
 
             user = get_user_by_username(username)
@@ -567,7 +766,7 @@ def register():
             session["username"] = user["username"]
             return redirect(url_for("main.index"))
 
-    return render_template(
+    return _render(
         "register.html",
         error=error,
         active_tab=None,